@@ -9,9 +9,28 @@ import anthropic
 import openai
 import time
 import re
-import subprocess
+import asyncio
+import json
+import hashlib
+import threading
+import os
+import httpx
+import numpy as np
+import pandas as pd
+from collections import deque
+from itertools import islice
 from datetime import datetime
 
+try:
+    import ahocorasick  # Optional: single-pass keyword scan
+except ImportError:
+    ahocorasick = None
+
+try:
+    import tiktoken  # Optional: real token counts instead of the chars/4 estimate
+except ImportError:
+    tiktoken = None
+
 # Cloud Model Configurations
 CLOUD_MODELS = {
     "Claude Sonnet 4": {
@@ -44,6 +63,20 @@ CLOUD_MODELS = {
     }
 }
 
+# Instructions sent ahead of every query, local and cloud alike, so side-by-side
+# answers are comparable. Keep this text byte-identical across calls so the
+# cloud providers' prompt-prefix caches can reuse it.
+SYSTEM_PROMPT = (
+    "You are a helpful, accurate assistant for business users. Answer clearly and concisely, "
+    "use Markdown formatting where it improves readability, and say so when you are unsure."
+)
+# Anthropic only caches prefixes marked with cache_control (5-minute ephemeral cache)
+ANTHROPIC_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+def chat_messages(query: str) -> list:
+    """Chat messages for Ollama and OpenAI: the fixed system prefix first, so OpenAI's prefix caching applies"""
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": query}]
+
 # Local model descriptions (matched by name patterns)
 LOCAL_MODEL_INFO = {
     "deepseek-r1": {
@@ -71,6 +104,10 @@ LOCAL_MODEL_INFO = {
         "best_for": ["Resource-limited", "Quick tasks", "Edge deployment", "Efficiency"]
     }
 }
+DEFAULT_LOCAL_MODEL_INFO = {
+    "description": "Local model running on your hardware. Fast, free, and private.",
+    "best_for": ["Privacy", "No API costs", "Fast responses", "Offline capable"]
+}
 
 def get_local_model_info(model_name: str) -> dict:
     """Get description info for a local model based on its name"""
@@ -78,32 +115,72 @@ def get_local_model_info(model_name: str) -> dict:
     for pattern, info in LOCAL_MODEL_INFO.items():
         if pattern in model_lower:
             return info
-    return {
-        "description": "Local model running on your hardware. Fast, free, and private.",
-        "best_for": ["Privacy", "No API costs", "Fast responses", "Offline capable"]
-    }
+    return DEFAULT_LOCAL_MODEL_INFO
+
+# Ollama server address, honouring the same OLLAMA_HOST variable as the ollama CLI
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+if "://" not in OLLAMA_HOST:
+    OLLAMA_HOST = f"http://{OLLAMA_HOST}"
+
+@st.cache_resource
+def _ollama_http() -> httpx.Client:
+    """Keep-alive HTTP client for Ollama's REST API"""
+    return httpx.Client(base_url=OLLAMA_HOST, timeout=5.0)
+
+@st.cache_resource
+def _ollama_client() -> ollama.Client:
+    """Shared Ollama client for chat and embeddings, so its connection pool is reused"""
+    return ollama.Client(host=OLLAMA_HOST)
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_available_local_models() -> list:
-    """Fetch list of models available in Ollama"""
+    """Fetch list of models available in Ollama (cached for a minute; see the refresh button)"""
     try:
-        result = subprocess.run(
-            ["ollama", "list"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')[1:]  # Skip header
-            models = []
-            for line in lines:
-                if line.strip():
-                    model_name = line.split()[0]
-                    models.append(model_name)
-            return models if models else ["No models found"]
-        return ["Error fetching models"]
+        response = _ollama_http().get("/api/tags")
+        response.raise_for_status()
+        models = [model["name"] for model in response.json().get("models", [])]
+        return models if models else ["No models found"]
     except Exception as e:
         return [f"Error: {str(e)}"]
 
+# Canned answers for common simple questions, served without calling any model
+FAQ_ANSWERS = {
+    "what is hipaa": (
+        "**HIPAA** (the Health Insurance Portability and Accountability Act of 1996) is a U.S. federal law "
+        "that sets national standards for protecting patients' health information. Its Privacy Rule limits "
+        "how protected health information (PHI) may be used and disclosed, and its Security Rule requires "
+        "administrative, physical, and technical safeguards for electronic PHI held by healthcare providers, "
+        "health plans, clearinghouses, and their business associates."
+    ),
+    "what is pci dss": (
+        "**PCI DSS** (Payment Card Industry Data Security Standard) is a security standard maintained by the "
+        "PCI Security Standards Council. It applies to any organization that stores, processes, or transmits "
+        "payment card data, and covers requirements such as network security, encryption of cardholder data, "
+        "access control, monitoring, and regular security testing."
+    ),
+    "what is ollama": (
+        "**Ollama** is an open-source tool for downloading and running large language models on your own "
+        "hardware. It exposes a simple local API, so applications can use models like DeepSeek-R1, Llama, "
+        "or Qwen without sending data to a cloud provider."
+    ),
+}
+
+def answer_from_faq(query: str) -> dict | None:
+    """Return a built-in answer for a known simple question, or None"""
+    answer = FAQ_ANSWERS.get(query.lower().strip(" ?.!\n\t").replace("-", " "))
+    if answer is None:
+        return None
+    return {
+        "success": True,
+        "response": answer,
+        "model": "Built-in FAQ",
+        "latency": 0.0,
+        "cost": 0.0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "faq": True
+    }
+
 # Pricing lookup (per 1M tokens)
 def get_pricing(model_key: str) -> dict:
     """Get pricing for a model"""
@@ -111,22 +188,86 @@ def get_pricing(model_key: str) -> dict:
         return CLOUD_MODELS[model_key]["pricing"]
     return {"input": 0, "output": 0}  # Local models are free
 
+# Complexity keywords and their score weights (heaviest first, so fast routing can stop early)
+COMPLEX_KEYWORDS = (
+    ('analyze deeply', 0.3),
+    ('comprehensive analysis', 0.3),
+    ('compare and contrast', 0.25),
+    ('critically evaluate', 0.25),
+    ('detailed explanation', 0.2),
+    ('strategic planning', 0.2),
+    ('analyze', 0.15),
+    ('compare', 0.15),
+    ('evaluate', 0.15),
+    ('complex', 0.15),
+    ('explain', 0.1),
+    ('multiple', 0.1),
+    ('various', 0.1),
+)
+EXAMPLE_PHRASES = ('step by step', 'examples', 'multiple examples')
+SIMPLE_PHRASES = ('what is', 'who is', 'when did', 'where is')
+SIMPLE_PREFIXES = SIMPLE_PHRASES + ('define ',)  # Short queries opening with these skip the scan under fast_route
+ROUTING_PHRASES = tuple(dict.fromkeys([kw for kw, _ in COMPLEX_KEYWORDS] + list(EXAMPLE_PHRASES) + list(SIMPLE_PHRASES)))
+
+# Byte patterns for the fallback scan: encode the query once, then search with bytes.__contains__
+_PHRASE_BYTES = tuple((phrase.encode(), phrase) for phrase in ROUTING_PHRASES)
+
+@st.cache_resource
+def _phrase_automaton():
+    """Build the Aho-Corasick automaton over every routing phrase (once per process)"""
+    automaton = ahocorasick.Automaton()
+    for phrase in ROUTING_PHRASES:
+        automaton.add_word(phrase, phrase)
+    automaton.make_automaton()
+    return automaton
+
+def find_phrases(query_lower: str, query_bytes: bytes) -> set:
+    """Return every routing phrase contained in the lowercased query (given as str and UTF-8 bytes)"""
+    if ahocorasick is not None:
+        return {phrase for _, phrase in _phrase_automaton().iter(query_lower)}
+    return {phrase for pattern, phrase in _PHRASE_BYTES if pattern in query_bytes}
+
 # Initialize session state
+MAX_HISTORY = 200  # Oldest queries drop off; running totals below still count them
 if 'queries' not in st.session_state:
-    st.session_state.queries = []
+    st.session_state.queries = deque(maxlen=MAX_HISTORY)
 if 'total_cost' not in st.session_state:
     st.session_state.total_cost = {"local": 0, "cloud": 0}
+if 'route_counts' not in st.session_state:
+    st.session_state.route_counts = {"local": 0, "cloud": 0}
+if 'batches' not in st.session_state:
+    st.session_state.batches = []  # Pending Batch API jobs
 
-def analyze_query_complexity(query: str) -> dict:
+def _routing_decision(score: float, factors: list, threshold: float) -> dict:
+    """Package a complexity score into the routing result"""
+    return {
+        "score": min(max(score, 0), 1),  # Clamp between 0-1
+        "factors": factors,
+        "route": "cloud" if score >= threshold else "local",
+        "threshold": threshold
+    }
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def analyze_query_complexity(query: str, fast_route: bool = False) -> dict:
     """
     Analyze query complexity to determine routing
+    With fast_route, short queries that open with a simple prefix go local without
+    a phrase scan (a heuristic: keywords later in the query are not weighed), and
+    scoring stops as soon as the route can no longer change. The score is then
+    partial, so it is not shown or recorded as the query's complexity
     Returns: {score: float, factors: list, route: str}
     """
     score = 0.0
     factors = []
+    threshold = 0.6  # Adjust based on testing
+    max_discount = 0.1  # Largest possible score reduction (simple question format)
+
+    # Lowercase and encode once; the length, punctuation and fallback phrase scans share the bytes
+    query_lower = query.lower()
+    query_bytes = query_lower.encode('utf-8', 'ignore')
 
     # Length analysis
-    word_count = len(query.split())
+    word_count = len(query_bytes.split())
     if word_count > 100:
         score += 0.3
         factors.append(f"Long query ({word_count} words)")
@@ -134,31 +275,23 @@ def analyze_query_complexity(query: str) -> dict:
         score += 0.15
         factors.append(f"Medium length ({word_count} words)")
 
-    # Complexity keywords
-    complex_keywords = {
-        'analyze deeply': 0.3,
-        'comprehensive analysis': 0.3,
-        'compare and contrast': 0.25,
-        'detailed explanation': 0.2,
-        'critically evaluate': 0.25,
-        'strategic planning': 0.2,
-        'analyze': 0.15,
-        'compare': 0.15,
-        'explain': 0.1,
-        'evaluate': 0.15,
-        'multiple': 0.1,
-        'complex': 0.15,
-        'various': 0.1
-    }
+    if fast_route and word_count < 30 and query_lower.lstrip().startswith(SIMPLE_PREFIXES):
+        return _routing_decision(0.05, ["Simple prefix fast path"], threshold)
 
-    query_lower = query.lower()
-    for keyword, weight in complex_keywords.items():
-        if keyword in query_lower:
+    # Single scan for keyword, example and simple-question phrases
+    found = find_phrases(query_lower, query_bytes)
+
+    # Complexity keywords
+    for keyword, weight in COMPLEX_KEYWORDS:
+        if keyword in found:
             score += weight
             factors.append(f"Complex keyword: '{keyword}'")
+            if fast_route and score - max_discount >= threshold:
+                factors.append("Early exit: already above threshold")
+                return _routing_decision(score, factors, threshold)
 
     # Multiple questions
-    question_marks = query.count('?')
+    question_marks = query_bytes.count(b'?')
     if question_marks > 2:
         score += 0.2
         factors.append(f"Multiple questions ({question_marks})")
@@ -167,69 +300,385 @@ def analyze_query_complexity(query: str) -> dict:
         factors.append(f"Two questions")
 
     # Request for examples/steps
-    if any(word in query_lower for word in ['step by step', 'examples', 'multiple examples']):
+    if not found.isdisjoint(EXAMPLE_PHRASES):
         score += 0.15
         factors.append("Requests examples/steps")
 
     # Simple indicators (reduce score)
-    if any(word in query_lower for word in ['what is', 'who is', 'when did', 'where is']):
+    if not found.isdisjoint(SIMPLE_PHRASES):
         score -= 0.1
         factors.append("Simple question format")
 
-    # Determine route
-    threshold = 0.6  # Adjust based on testing
-    route = "cloud" if score >= threshold else "local"
-
-    return {
-        "score": min(max(score, 0), 1),  # Clamp between 0-1
-        "factors": factors,
-        "route": route,
-        "threshold": threshold
-    }
+    return _routing_decision(score, factors, threshold)
+
+TOKEN_ENCODER_RETRY = 60  # Seconds between attempts to load the encoder after a failure
+
+@st.cache_resource
+def _token_encoder_state() -> dict:
+    """Process-wide encoder slot; only a successfully loaded encoder is kept"""
+    return {"encoder": None, "retry_at": 0.0}
+
+def _token_encoder():
+    """cl100k_base encoder, loaded once per process (None while tiktoken or its data is unavailable)"""
+    if tiktoken is None:
+        return None
+    state = _token_encoder_state()
+    if state["encoder"] is None and time.time() >= state["retry_at"]:
+        try:
+            state["encoder"] = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # e.g. offline first start: the BPE file could not be downloaded; try again later
+            state["retry_at"] = time.time() + TOKEN_ENCODER_RETRY
+    return state["encoder"]
+
+# Texts longer than this (chars) are token-counted from evenly spaced sample windows
+TOKEN_SAMPLE_THRESHOLD = 8192
+TOKEN_SAMPLE_WINDOWS = 4
+TOKEN_SAMPLE_SIZE = 512
 
 def estimate_tokens(text: str) -> int:
-    """Rough token estimation: ~4 chars per token"""
-    return len(text) // 4
+    """Token count via tiktoken's cl100k_base, falling back to ~4 chars per token"""
+    encoder = _token_encoder()
+    if encoder is None:
+        return len(text) // 4
+    if len(text) <= TOKEN_SAMPLE_THRESHOLD:
+        return len(encoder.encode(text, disallowed_special=()))
+
+    # Long text: tokenize a few windows and scale by their tokens-per-char ratio
+    step = (len(text) - TOKEN_SAMPLE_SIZE) // (TOKEN_SAMPLE_WINDOWS - 1)
+    sample_tokens = sum(
+        len(encoder.encode(text[i * step:i * step + TOKEN_SAMPLE_SIZE], disallowed_special=()))
+        for i in range(TOKEN_SAMPLE_WINDOWS)
+    )
+    return round(sample_tokens * len(text) / (TOKEN_SAMPLE_WINDOWS * TOKEN_SAMPLE_SIZE))
 
 def calculate_cost(input_tokens: int, output_tokens: int, model: str) -> float:
     """Calculate API cost"""
-    pricing = PRICING.get(model, {"input": 0, "output": 0})
+    pricing = get_pricing(model)
     cost = (input_tokens * pricing["input"] / 1_000_000) + \
            (output_tokens * pricing["output"] / 1_000_000)
     return cost
 
-def local_inference(query: str, model: str) -> dict:
-    """Run inference on local Ollama model"""
+# Semantic cache: reuse answers for paraphrased prompts ("What is HIPAA?" vs "what's hipaa")
+EMBEDDING_MODEL = "nomic-embed-text"  # Ollama embedding model; cache is skipped if not pulled
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity to reuse a response
+CACHE_SIZE = MAX_HISTORY  # Responses (and routes) kept per process; the oldest are evicted first
+
+@st.cache_resource
+def _response_cache() -> dict:
+    """Process-wide store of successful responses, keyed by model + prompt, oldest first"""
+    return {}
+
+@st.cache_resource
+def _semantic_index() -> dict:
+    """Per-model (embeddings, response cache keys) snapshots: float16 rows and the key for each row"""
+    return {}
+
+@st.cache_resource
+def _semantic_lock() -> threading.Lock:
+    """Serializes updates to the semantic indexes, which every session's thread shares"""
+    return threading.Lock()
+
+def _cache_key(model: str, query: str) -> str:
+    """Stable SHA-256 key for a model/prompt pair"""
+    return hashlib.sha256(json.dumps({"m": model, "q": query}, sort_keys=True).encode()).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def embed_query(query: str):
+    """Unit-length prompt embedding from Ollama, or None if no embedding model is available"""
+    try:
+        vector = np.asarray(_ollama_client().embeddings(model=EMBEDDING_MODEL, prompt=query)['embedding'], dtype=np.float32)
+    except Exception:
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+def _semantic_match(index: tuple | None, query: str) -> tuple | None:
+    """(value, similarity) of the closest stored embedding, if above the cache threshold"""
+    if not index:
+        return None
+    embeddings, values = index  # One snapshot, so rows and values always line up
+    vector = embed_query(query)
+    if vector is None or vector.shape[0] != embeddings.shape[1]:
+        return None
+    similarities = embeddings @ vector
+    best = int(similarities.argmax())
+    if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+        return None
+    return values[best], float(similarities[best])
+
+def _append_embedding(index: tuple | None, vector: np.ndarray, value, max_rows: int = CACHE_SIZE) -> tuple:
+    """
+    New (embeddings, values) snapshot with one more row, keeping at most max_rows (oldest dropped)
+    Starts fresh if the embedding size changed
+    """
+    if index is None or index[0].shape[1] != vector.shape[0]:
+        index = (np.empty((0, vector.shape[0]), dtype=np.float16), ())
+    embeddings, values = index
+    return np.vstack([embeddings, vector.astype(np.float16)])[-max_rows:], (values + (value,))[-max_rows:]
+
+def _evict_oldest_response(cache: dict, indexes: dict):
+    """Drop the oldest cached response and its semantic index row (always its model's first row)"""
+    oldest = next(iter(cache))
+    del cache[oldest]
+    for model, (embeddings, values) in indexes.items():
+        if values and values[0] == oldest:
+            indexes[model] = (embeddings[1:], values[1:])
+            break
+
+def get_cached_response(model: str, query: str) -> dict | None:
+    """Return a previously generated response for this prompt or a close paraphrase, if any"""
+    cache = _response_cache()
+    entry = cache.get(_cache_key(model, query))
+    if entry is not None:
+        return {"success": True, **entry, "cached": True, "latency": 0.0, "cost": 0.0}
+
+    match = _semantic_match(_semantic_index().get(model), query)
+    if match is None:
+        return None
+    key, similarity = match
+    entry = cache.get(key)  # May have been evicted since the snapshot was taken
+    if entry is None:
+        return None
+    return {"success": True, **entry, "cached": True,
+            "similarity": similarity, "latency": 0.0, "cost": 0.0}
+
+def store_response(model: str, query: str, result: dict):
+    """Remember a successful response so identical or paraphrased prompts skip the model call"""
+    key = _cache_key(model, query)
+    entry = {field: result[field] for field in ("response", "model", "input_tokens", "output_tokens")}
+    vector = embed_query(query)  # Blocking Ollama request, so made before taking the lock
+
+    cache = _response_cache()
+    indexes = _semantic_index()
+    with _semantic_lock():
+        is_new = key not in cache
+        cache[key] = entry
+        if not is_new:
+            return  # Refreshed in place; its embedding row is already indexed
+        if len(cache) > CACHE_SIZE:
+            _evict_oldest_response(cache, indexes)
+        if vector is not None:
+            indexes[model] = _append_embedding(indexes.get(model), vector, key)
+
+@st.cache_resource
+def _route_index() -> dict:
+    """Auto Route decisions by query embedding: {"index": (embeddings, routes)}"""
+    return {}
+
+def get_cached_route(query: str) -> tuple[str, float] | None:
+    """Route chosen for a close paraphrase of this query, and its similarity, if any"""
+    return _semantic_match(_route_index().get("index"), query)
+
+def store_route(query: str, route: str):
+    """Remember an Auto Route decision so paraphrases take the same route (and hit its response cache)"""
+    vector = embed_query(query)
+    if vector is None:
+        return
+    routes = _route_index()
+    with _semantic_lock():
+        routes["index"] = _append_embedding(routes.get("index"), vector, route)
+
+def _local_result(query: str, model: str, response_text: str, stats, latency: float) -> dict:
+    """Build the result dict for a completed Ollama chat response"""
+    # Ollama reports exact counts and decode time (ns); prompt_eval_count is omitted for cached prompts
+    input_tokens = stats.get('prompt_eval_count') or estimate_tokens(query)
+    output_tokens = stats.get('eval_count') or 0
+    eval_seconds = (stats.get('eval_duration') or 0) / 1e9
+    return {
+        "success": True,
+        "response": response_text,
+        "model": model,
+        "latency": latency,
+        "tokens_per_sec": output_tokens / (eval_seconds or latency),
+        "cost": 0.0,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens
+    }
+
+def _cloud_result(cloud_model_key: str, response_text: str, input_tokens: int, output_tokens: int,
+                  latency: float) -> dict:
+    """Build the result dict for a completed Anthropic or OpenAI response"""
+    model_config = CLOUD_MODELS[cloud_model_key]
+    cost = calculate_cost(input_tokens, output_tokens, cloud_model_key)
+
+    return {
+        "success": True,
+        "response": response_text,
+        "model": f"{cloud_model_key} ({model_config['id']})",
+        "latency": latency,
+        "cost": cost,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens
+    }
+
+def _render_stream(chunks, stream_to) -> tuple:
+    """Write text chunks into a Streamlit container as they arrive; returns (full text, first-token time)"""
+    first_token_at = []
+
+    def timed_chunks():
+        for chunk in chunks:
+            if chunk and not first_token_at:
+                first_token_at.append(time.time())
+            yield chunk
+
+    text = "".join(timed_chunks()) if stream_to is None else stream_to.write_stream(timed_chunks())
+    return text, (first_token_at[0] if first_token_at else time.time())
+
+def _ollama_chunks(stream, stats: dict):
+    """Yield the text of each chunk in an Ollama chat stream, capturing the closing chunk's counters"""
+    for chunk in stream:
+        if chunk.get('done'):
+            stats.update({field: chunk.get(field) for field in ('prompt_eval_count', 'eval_count', 'eval_duration')})
+        yield chunk['message']['content']
+
+def _openai_chunks(stream, usage: dict):
+    """Yield the text of each chunk in an OpenAI chat stream, capturing usage and the tier served"""
+    for chunk in stream:
+        if chunk.usage:
+            usage["input"] = chunk.usage.prompt_tokens
+            usage["output"] = chunk.usage.completion_tokens
+        if getattr(chunk, "service_tier", None):
+            usage["tier"] = chunk.service_tier
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+@st.cache_resource
+def _anthropic_client():
+    """Shared Anthropic client, so its connection pool is reused across queries"""
+    return anthropic.Anthropic()
+
+@st.cache_resource
+def _openai_client():
+    """Shared OpenAI client, so its connection pool is reused across queries"""
+    return openai.OpenAI()
+
+def local_inference(query: str, model: str, stream_to=None) -> dict:
+    """Run inference on local Ollama model, streaming tokens into `stream_to` if given"""
+    cached = get_cached_response(model, query)
+    if cached:
+        return cached
+
     start_time = time.time()
 
     try:
-        response = ollama.chat(
+        stream = _ollama_client().chat(
             model=model,
-            messages=[{"role": "user", "content": query}]
+            messages=chat_messages(query),
+            stream=True
         )
+        stats = {}
+        response_text, first_token_at = _render_stream(_ollama_chunks(stream, stats), stream_to)
 
-        end_time = time.time()
-        response_text = response['message']['content']
-
+        result = _local_result(query, model, response_text, stats, time.time() - start_time)
+        result["ttft"] = first_token_at - start_time
+        store_response(model, query, result)
+        return result
+    except Exception as e:
         return {
-            "success": True,
-            "response": response_text,
-            "model": model,
-            "latency": end_time - start_time,
-            "tokens_per_sec": estimate_tokens(response_text) / (end_time - start_time),
-            "cost": 0.0,
-            "input_tokens": estimate_tokens(query),
-            "output_tokens": estimate_tokens(response_text)
+            "success": False,
+            "error": str(e),
+            "model": model
         }
+
+def cloud_inference(query: str, cloud_model_key: str, stream_to=None, low_latency: bool = False) -> dict:
+    """Run inference on cloud API, streaming tokens into `stream_to` if given
+
+    low_latency requests OpenAI's priority tier; Anthropic models ignore it.
+    """
+    cached = get_cached_response(cloud_model_key, query)
+    if cached:
+        return cached
+
+    start_time = time.time()
+
+    model_config = CLOUD_MODELS.get(cloud_model_key)
+    if not model_config:
+        return {"success": False, "error": f"Unknown cloud model: {cloud_model_key}", "model": cloud_model_key}
+
+    model_id = model_config["id"]
+    tier = None
+
+    try:
+        if model_config["provider"] == "anthropic":
+            client = _anthropic_client()
+            with client.messages.stream(
+                model=model_id,
+                max_tokens=2000,
+                system=ANTHROPIC_SYSTEM,
+                messages=[{"role": "user", "content": query}]
+            ) as stream:
+                response_text, first_token_at = _render_stream(stream.text_stream, stream_to)
+                usage = stream.get_final_message().usage
+            input_tokens = usage.input_tokens
+            output_tokens = usage.output_tokens
+
+        else:  # OpenAI
+            client = _openai_client()
+            stream = client.chat.completions.create(
+                model=model_id,
+                messages=chat_messages(query),
+                stream=True,
+                stream_options={"include_usage": True},
+                **({"service_tier": "priority"} if low_latency else {})
+            )
+            usage = {}
+            response_text, first_token_at = _render_stream(_openai_chunks(stream, usage), stream_to)
+            input_tokens = usage.get("input", 0)
+            output_tokens = usage.get("output", 0)
+            tier = usage.get("tier")
+
+        result = _cloud_result(cloud_model_key, response_text, input_tokens, output_tokens,
+                               time.time() - start_time)
+        result["ttft"] = first_token_at - start_time
+        if tier:
+            result["tier"] = tier
+        store_response(cloud_model_key, query, result)
+        return result
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
-            "model": model
+            "model": cloud_model_key
         }
 
-def cloud_inference(query: str, cloud_model_key: str) -> dict:
-    """Run inference on cloud API"""
+# Async clients are bound to the event loop that created them, so they are
+# created lazily per asyncio.run() call and shared by every request in it.
+ASYNC_CLIENT_FACTORIES = {
+    "ollama": lambda: ollama.AsyncClient(host=OLLAMA_HOST),
+    "anthropic": lambda: anthropic.AsyncAnthropic(),
+    "openai": lambda: openai.AsyncOpenAI(),
+}
+
+def _async_client(clients: dict, provider: str):
+    """Get or create the async client for a provider within the current event loop"""
+    if provider not in clients:
+        clients[provider] = ASYNC_CLIENT_FACTORIES[provider]()
+    return clients[provider]
+
+async def _close_async_client(client):
+    """Close an async client's HTTP connections"""
+    if hasattr(client, "close"):  # AsyncAnthropic, AsyncOpenAI and ollama>=0.4 AsyncClient
+        await client.close()
+    else:  # Older ollama.AsyncClient: close its httpx client directly
+        await client._client.aclose()
+
+async def local_inference_async(query: str, model: str, clients: dict) -> dict:
+    """Async variant of local_inference using ollama.AsyncClient (caching is left to run_concurrently)"""
+    start_time = time.time()
+
+    try:
+        response = await _async_client(clients, "ollama").chat(
+            model=model,
+            messages=chat_messages(query)
+        )
+
+        return _local_result(query, model, response['message']['content'], response, time.time() - start_time)
+    except Exception as e:
+        return {"success": False, "error": str(e), "model": model}
+
+async def cloud_inference_async(query: str, cloud_model_key: str, clients: dict, low_latency: bool = False) -> dict:
+    """Async variant of cloud_inference using the providers' async clients (caching is left to run_concurrently)"""
     start_time = time.time()
 
     model_config = CLOUD_MODELS.get(cloud_model_key)
@@ -238,61 +687,281 @@ def cloud_inference(query: str, cloud_model_key: str) -> dict:
 
     model_id = model_config["id"]
     provider = model_config["provider"]
-    pricing = model_config["pricing"]
 
     try:
+        client = _async_client(clients, provider)
         if provider == "anthropic":
-            client = anthropic.Anthropic()
-            response = client.messages.create(
+            response = await client.messages.create(
                 model=model_id,
                 max_tokens=2000,
+                system=ANTHROPIC_SYSTEM,
                 messages=[{"role": "user", "content": query}]
             )
             response_text = response.content[0].text
             input_tokens = response.usage.input_tokens
             output_tokens = response.usage.output_tokens
-
         else:  # OpenAI
-            client = openai.OpenAI()
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=model_id,
-                messages=[{"role": "user", "content": query}]
+                messages=chat_messages(query),
+                **({"service_tier": "priority"} if low_latency else {})
             )
             response_text = response.choices[0].message.content
             input_tokens = response.usage.prompt_tokens
             output_tokens = response.usage.completion_tokens
 
-        end_time = time.time()
+        result = _cloud_result(cloud_model_key, response_text, input_tokens, output_tokens,
+                               time.time() - start_time)
+        tier = getattr(response, "service_tier", None)
+        if tier:
+            result["tier"] = tier
+        return result
+    except Exception as e:
+        return {"success": False, "error": str(e), "model": cloud_model_key}
 
-        # Calculate cost
-        cost = (input_tokens * pricing["input"] / 1_000_000) + \
-               (output_tokens * pricing["output"] / 1_000_000)
+async def _gather_calls(calls: list, max_concurrency: int, low_latency: bool) -> list:
+    """Run (route, query, model) calls concurrently, at most max_concurrency in flight"""
+    clients = {}
+    semaphore = asyncio.Semaphore(max_concurrency)  # Stay under provider rate limits
 
-        return {
-            "success": True,
-            "response": response_text,
-            "model": f"{cloud_model_key} ({model_id})",
-            "latency": end_time - start_time,
-            "cost": cost,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "model": cloud_model_key
+    async def call(route: str, query: str, model: str) -> dict:
+        async with semaphore:
+            if route == "local":
+                return await local_inference_async(query, model, clients)
+            return await cloud_inference_async(query, model, clients, low_latency)
+
+    try:
+        return await asyncio.gather(*[call(*c) for c in calls])
+    finally:
+        # Close the connection pools before asyncio.run() closes the loop they belong to
+        await asyncio.gather(*[_close_async_client(client) for client in clients.values()],
+                             return_exceptions=True)
+
+def run_concurrently(calls: list, use_cache: bool = True, max_concurrency: int = 10,
+                     low_latency: bool = False) -> list:
+    """
+    Run (route, query, model) calls concurrently and return their results in order
+    Cache lookups and stores happen here, outside the event loop: embedding a
+    prompt is a blocking Ollama request that would stall every call in flight
+    """
+    results = [get_cached_response(model, query) if use_cache else None for _, query, model in calls]
+    misses = [idx for idx, result in enumerate(results) if result is None]
+    fresh = asyncio.run(_gather_calls([calls[idx] for idx in misses], max_concurrency, low_latency))
+    for idx, result in zip(misses, fresh):
+        results[idx] = result
+        if result['success']:
+            _, query, model = calls[idx]
+            store_response(model, query, result)
+    return results
+
+def compare_inference(query: str, local_model: str, cloud_model_key: str, use_cache: bool = True,
+                      low_latency: bool = False) -> list:
+    """Run the local and cloud models on the same query concurrently; returns [local, cloud]"""
+    return run_concurrently([("local", query, local_model), ("cloud", query, cloud_model_key)], use_cache,
+                            low_latency=low_latency)
+
+def route_for_replay(query: str) -> dict:
+    """
+    Routing used by replay and batch mode alike: the full analysis, so replayed
+    queries take the route Auto Route took and history records their real score
+    """
+    return analyze_query_complexity(query)
+
+def replay_queries(queries: list, local_model: str, cloud_model_key: str, use_cache: bool = False,
+                   route: str | None = None, max_concurrency: int = 10, low_latency: bool = False) -> list:
+    """
+    Re-run past queries concurrently; returns (route, analysis, result) per query
+    Each query is re-routed with route_for_replay unless `route` forces one
+    """
+    analyses = [route_for_replay(query) for query in queries]
+    routes = [route or analysis['route'] for analysis in analyses]
+    results = [answer_from_faq(query) if query_route == "local" else None
+               for query, query_route in zip(queries, routes)]
+    pending = [idx for idx, result in enumerate(results) if result is None]
+    calls = [
+        (routes[idx], queries[idx], local_model if routes[idx] == "local" else cloud_model_key)
+        for idx in pending
+    ]
+    for idx, result in zip(pending, run_concurrently(calls, use_cache, max_concurrency, low_latency)):
+        results[idx] = result
+    return list(zip(routes, analyses, results))
+
+# Batch API jobs complete within 24h and are billed at half the online price
+BATCH_DISCOUNT = 0.5
+BATCH_DONE = ("completed", "failed", "expired", "cancelled")  # Terminal job states
+BATCH_POLL_INITIAL = 2.0  # Seconds before the first status check; doubles each time
+BATCH_POLL_MAX = 30.0
+
+def submit_openai_batch(queries: list, cloud_model_key: str) -> str:
+    """Upload queries as one OpenAI Batch API job; returns the batch id"""
+    model_id = CLOUD_MODELS[cloud_model_key]["id"]
+    lines = [
+        json.dumps({
+            "custom_id": str(idx),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model_id, "messages": chat_messages(query)}
+        })
+        for idx, query in enumerate(queries)
+    ]
+    client = _openai_client()
+    batch_file = client.files.create(file=("replay.jsonl", "\n".join(lines).encode()), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
+def collect_openai_batch(batch_id: str, cloud_model_key: str) -> tuple:
+    """
+    Check a batch job; returns (status, {custom_id: result}) with results only once completed
+    Failed requests are listed in the error file; a batch where all of them failed has no output file
+    """
+    client = _openai_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        return batch.status, {}
+
+    latency = (batch.completed_at or batch.created_at) - batch.created_at
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            item = json.loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            if item.get("error") or "choices" not in body:
+                results[item["custom_id"]] = {"success": False, "error": str(item.get("error") or body),
+                                              "model": cloud_model_key}
+                continue
+            result = _cloud_result(cloud_model_key, body["choices"][0]["message"]["content"],
+                                   body["usage"]["prompt_tokens"], body["usage"]["completion_tokens"], latency)
+            result["cost"] *= BATCH_DISCOUNT
+            results[item["custom_id"]] = result
+    return batch.status, results
+
+def submit_anthropic_batch(queries: list, cloud_model_key: str) -> str:
+    """Send queries as one Anthropic Message Batches job; returns the batch id"""
+    model_id = CLOUD_MODELS[cloud_model_key]["id"]
+    batch = _anthropic_client().messages.batches.create(requests=[
+        {
+            "custom_id": str(idx),
+            "params": {
+                "model": model_id,
+                "max_tokens": 2000,
+                "system": ANTHROPIC_SYSTEM,
+                "messages": [{"role": "user", "content": query}]
+            }
         }
+        for idx, query in enumerate(queries)
+    ])
+    return batch.id
+
+def collect_anthropic_batch(batch_id: str, cloud_model_key: str) -> tuple:
+    """Check a Message Batches job; returns (status, {custom_id: result}) with results only once ended"""
+    client = _anthropic_client()
+    batch = client.messages.batches.retrieve(batch_id)
+    if batch.processing_status != "ended":
+        return batch.processing_status, {}
+
+    latency = ((batch.ended_at or batch.created_at) - batch.created_at).total_seconds()
+    results = {}
+    for item in client.messages.batches.results(batch_id):
+        if item.result.type != "succeeded":
+            results[item.custom_id] = {"success": False, "error": f"Batch request {item.result.type}",
+                                       "model": cloud_model_key}
+            continue
+        message = item.result.message
+        result = _cloud_result(cloud_model_key, message.content[0].text,
+                               message.usage.input_tokens, message.usage.output_tokens, latency)
+        result["cost"] *= BATCH_DISCOUNT
+        results[item.custom_id] = result
+    return "completed", results
+
+def submit_batch(queries: list, cloud_model_key: str) -> dict:
+    """Queue queries with the cloud model's batch API; returns the pending-batch record"""
+    if CLOUD_MODELS[cloud_model_key]["provider"] == "anthropic":
+        batch_id = submit_anthropic_batch(queries, cloud_model_key)
+    else:
+        batch_id = submit_openai_batch(queries, cloud_model_key)
+    return {"id": batch_id, "model": cloud_model_key, "queries": queries}
+
+def collect_batch(batch: dict) -> tuple:
+    """Check a pending batch with its provider; returns (status, {custom_id: result})"""
+    if CLOUD_MODELS[batch["model"]]["provider"] == "anthropic":
+        return collect_anthropic_batch(batch["id"], batch["model"])
+    return collect_openai_batch(batch["id"], batch["model"])
+
+def cancel_batch(batch: dict):
+    """Ask the provider to stop a batch; requests already processed are still billed"""
+    if CLOUD_MODELS[batch["model"]]["provider"] == "anthropic":
+        _anthropic_client().messages.batches.cancel(batch["id"])
+    else:
+        _openai_client().batches.cancel(batch["id"])
+
+def wait_for_batch(batch: dict, timeout: float) -> tuple:
+    """Poll a batch with exponential backoff until it finishes or timeout (seconds) passes"""
+    deadline = time.time() + timeout
+    delay = BATCH_POLL_INITIAL
+    while True:
+        status, results = collect_batch(batch)
+        remaining = deadline - time.time()
+        if status in BATCH_DONE or remaining <= 0:
+            return status, results
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, BATCH_POLL_MAX)
+
+def record_query(query: str, route: str, result: dict, analysis: dict):
+    """Append a successful query to the session history and update the running totals"""
+    st.session_state.route_counts[route] += 1
+    st.session_state.total_cost[route] += result['cost']
+    st.session_state.queries.append({
+        "query": query,
+        "route": route,
+        "model": result['model'],
+        "latency": result['latency'],
+        "cost": result['cost'],
+        "timestamp": datetime.now().isoformat(),
+        "complexity_score": analysis['score'],
+        "tier": result.get('tier')
+    })
+
+def record_batch_results(batch: dict, results: dict) -> int:
+    """Add a finished batch's successful results to history; returns how many were added"""
+    added = 0
+    for idx, batch_query in enumerate(batch["queries"]):
+        batch_result = results.get(str(idx))
+        if batch_result and batch_result['success']:
+            record_query(batch_query, "cloud", batch_result, route_for_replay(batch_query))
+            added += 1
+    return added
+
+def replay_online(queries: list, local_model: str, cloud_model_key: str, use_cache: bool,
+                  route: str | None = None, low_latency: bool = False):
+    """Run queries concurrently (re-routed unless `route` forces one), record them, and report the timing"""
+    with st.spinner(f"Replaying {len(queries)} queries concurrently..."):
+        start_time = time.time()
+        replayed = replay_queries(queries, local_model, cloud_model_key, use_cache=use_cache, route=route,
+                                  low_latency=low_latency)
+        wall_time = time.time() - start_time
+
+    succeeded = 0
+    for replay_query, (replay_route, replay_analysis, replay_result) in zip(queries, replayed):
+        if replay_result['success']:
+            record_query(replay_query, replay_route, replay_result, replay_analysis)
+            succeeded += 1
+    sequential_time = sum(r['latency'] for _, _, r in replayed if r['success'])
+    st.success(f"Replayed {succeeded}/{len(queries)} queries in {wall_time:.2f}s "
+               f"({sequential_time:.2f}s if run one after the other)")
+    failures = [r.get('error', 'Unknown error') for _, _, r in replayed if not r['success']]
+    if failures:
+        st.error(f"{len(failures)} failed, e.g.: {failures[0]}")
 
 # Streamlit UI
-st.set_page_config(
-    page_title="LeniLani AI Hybrid Router",
-    page_icon="🤖",
-    layout="wide"
-)
-
-# Custom CSS
-st.markdown("""
+# Static markup, built once per script run and re-sent unchanged. It must be
+# emitted on every rerun: Streamlit drops elements a rerun does not redraw.
+APP_CSS = """
 <style>
     .big-font {
         font-size: 24px !important;
@@ -313,7 +982,23 @@ st.markdown("""
         font-weight: bold;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+FOOTER_HTML = """
+<div style='text-align: center; color: #666; padding: 20px;'>
+    <strong>LeniLani Consulting</strong> | AI & Technology Consulting for Hawaii Businesses<br>
+    808-XXX-XXXX | reno@lenilani.com | lenilani.com
+</div>
+"""
+
+st.set_page_config(
+    page_title="LeniLani AI Hybrid Router",
+    page_icon="🤖",
+    layout="wide"
+)
+
+# Custom CSS
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # Header
 st.title("🤖 LeniLani AI Hybrid Router")
@@ -362,7 +1047,14 @@ with st.sidebar:
     available_local_models = get_available_local_models()
 
     # Local Model Selection
-    st.markdown("**🏠 Local Model**")
+    col_local_label, col_local_refresh = st.columns([3, 1])
+    with col_local_label:
+        st.markdown("**🏠 Local Model**")
+    with col_local_refresh:
+        if st.button("🔄", help="Refresh the list of Ollama models"):
+            get_available_local_models.clear()
+            st.rerun()
+
     selected_local_model = st.selectbox(
         "Choose local model:",
         available_local_models,
@@ -402,11 +1094,28 @@ with st.sidebar:
 
     st.markdown("---")
 
+    shadow_mode = st.checkbox(
+        "👥 Shadow comparison",
+        help="On Auto Route, also run the route not chosen, concurrently, to compare answers"
+    )
+
+    low_latency = st.toggle(
+        "⚡ Low-latency mode",
+        help="Request OpenAI's priority processing tier for online cloud queries (routed, Compare, Shadow "
+             "and Replay; not batch jobs). Priority tokens are billed at a premium that the cost figures "
+             "here do not include."
+    )
+    if low_latency and CLOUD_MODELS[selected_cloud_model]["provider"] != "openai":
+        st.caption("Not available for Anthropic models - their first-party API has no latency tier.")
+
+    st.markdown("---")
+
     st.header("📊 Session Statistics")
 
-    total_queries = len(st.session_state.queries)
-    local_queries = sum(1 for q in st.session_state.queries if q['route'] == 'local')
-    cloud_queries = total_queries - local_queries
+    # Running totals, updated in record_query(), keep the sidebar O(1) per rerun
+    local_queries = st.session_state.route_counts['local']
+    cloud_queries = st.session_state.route_counts['cloud']
+    total_queries = local_queries + cloud_queries
 
     col1, col2 = st.columns(2)
     with col1:
@@ -417,7 +1126,7 @@ with st.sidebar:
 
     st.markdown("---")
 
-    total_cost = sum(q.get('cost', 0) for q in st.session_state.queries)
+    total_cost = st.session_state.total_cost['local'] + st.session_state.total_cost['cloud']
     st.metric("💰 Total API Cost", f"${total_cost:.4f}")
 
     # Calculate savings
@@ -431,8 +1140,9 @@ with st.sidebar:
         st.metric("💵 Estimated Savings", f"${savings:.2f}", f"{savings_pct:.0f}%")
 
     if st.button("🗑️ Clear History"):
-        st.session_state.queries = []
+        st.session_state.queries = deque(maxlen=MAX_HISTORY)
         st.session_state.total_cost = {"local": 0, "cloud": 0}
+        st.session_state.route_counts = {"local": 0, "cloud": 0}
         st.rerun()
 
 # Main content
@@ -463,7 +1173,7 @@ with col1:
         placeholder="Type your question here..."
     )
 
-    col_btn1, col_btn2, col_btn3 = st.columns(3)
+    col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
 
     with col_btn1:
         run_auto = st.button("🚀 Auto Route", type="primary", use_container_width=True)
@@ -471,13 +1181,16 @@ with col1:
         force_local = st.button("🏠 Force Local", use_container_width=True)
     with col_btn3:
         force_cloud = st.button("☁️ Force Cloud", use_container_width=True)
+    with col_btn4:
+        compare_both = st.button("⚖️ Compare Both", use_container_width=True)
+
+# Analyze once per rerun; shared by the decision panel and query processing
+analysis = analyze_query_complexity(query) if query else None
 
 with col2:
     st.header("🎚️ Routing Decision")
 
-    if query:
-        analysis = analyze_query_complexity(query)
-
+    if analysis:
         # Complexity score visualization
         st.markdown(f"**Complexity Score: {analysis['score']:.2f}**")
         st.progress(analysis['score'])
@@ -495,97 +1208,246 @@ with col2:
             for factor in analysis['factors']:
                 st.markdown(f"- {factor}")
 
+# Get selected models from session state
+local_model = st.session_state.get('local_model_select', available_local_models[0] if available_local_models else "deepseek-r1:7b")
+cloud_model = st.session_state.get('cloud_model_select', 'Claude Sonnet 4')
+
 # Process query
 if query and (run_auto or force_local or force_cloud):
-    analysis = analyze_query_complexity(query)
-
-    # Determine route
+    # Determine route; Auto Route reuses the decision made for a close paraphrase
+    cached_route = None
     if force_local:
         route = "local"
     elif force_cloud:
         route = "cloud"
     else:
-        route = analysis['route']
-
-    # Get selected models from session state
-    local_model = st.session_state.get('local_model_select', available_local_models[0] if available_local_models else "deepseek-r1:7b")
-    cloud_model = st.session_state.get('cloud_model_select', 'Claude Sonnet 4')
+        cached_route = get_cached_route(query)
+        route = cached_route[0] if cached_route else analysis['route']
 
     # Show routing decision
     st.markdown("---")
     model_display = local_model if route == "local" else cloud_model
     st.markdown(f"### 🎯 Routing to: <span class='{'local-route' if route == 'local' else 'cloud-route'}'>{route.upper()}</span> → {model_display}",
                unsafe_allow_html=True)
+    if cached_route:
+        st.caption(f"🎯 Route reused from a similar earlier query ({cached_route[1]:.2f} similar)")
 
-    # Execute query
+    col_result1, col_result2 = st.columns([2, 1])
+
+    # Execute query, streaming tokens into the response column as they arrive
+    with col_result1:
+        st.markdown("### 💬 Response")
+        response_area = st.container()
+
+    # Shadow mode runs both routes at once, so the chosen one is not streamed
+    shadow_result = None
     with st.spinner(f"Processing with {model_display}..."):
-        if route == "local":
-            result = local_inference(query, local_model)
+        if shadow_mode and run_auto:
+            local_result, cloud_result = compare_inference(query, local_model, cloud_model, low_latency=low_latency)
+            result, shadow_result = (local_result, cloud_result) if route == "local" else (cloud_result, local_result)
+        elif route == "local":
+            result = answer_from_faq(query) or local_inference(query, local_model, stream_to=response_area)
         else:
-            result = cloud_inference(query, cloud_model)
+            result = cloud_inference(query, cloud_model, stream_to=response_area, low_latency=low_latency)
 
     # Display results
     if result['success']:
-        col_result1, col_result2 = st.columns([2, 1])
-
-        with col_result1:
-            st.markdown("### 💬 Response")
-            st.markdown(result['response'])
+        if result.get('cached') or result.get('faq') or shadow_result:
+            response_area.markdown(result['response'])
 
         with col_result2:
             st.markdown("### 📊 Performance")
 
+            if 'similarity' in result:
+                st.success(f"🎯 Semantic cache hit ({result['similarity']:.2f} similar) - no model call")
+            elif result.get('cached'):
+                st.success("🎯 Cache hit - no model call")
+            elif result.get('faq'):
+                st.success("📖 Answered from built-in FAQ - no model call")
+
+            if 'ttft' in result:
+                st.metric("⏱️ First Token", f"{result['ttft']:.2f}s")
+
             st.metric("⚡ Latency", f"{result['latency']:.2f}s")
 
-            if route == "local":
+            if 'tokens_per_sec' in result:
                 st.metric("🚀 Speed", f"{result.get('tokens_per_sec', 0):.1f} t/s")
 
             st.metric("💰 Cost", f"${result['cost']:.6f}")
 
+            if 'tier' in result:
+                st.caption(f"Service tier: {result['tier']}")
+
             # Token usage
             with st.expander("📝 Token Usage"):
                 st.write(f"Input: {result.get('input_tokens', 0):,}")
                 st.write(f"Output: {result.get('output_tokens', 0):,}")
 
         # Save to history
-        st.session_state.queries.append({
-            "query": query,
-            "route": route,
-            "model": result['model'],
-            "latency": result['latency'],
-            "cost": result['cost'],
-            "timestamp": datetime.now().isoformat(),
-            "complexity_score": analysis['score']
-        })
+        record_query(query, route, result, analysis)
+        if run_auto and not cached_route:
+            store_route(query, route)
 
     else:
-        st.error(f"Error: {result.get('error', 'Unknown error')}")
+        response_area.error(f"Error: {result.get('error', 'Unknown error')}")
+
+    if shadow_result:
+        shadow_route = "cloud" if route == "local" else "local"
+        with st.expander(f"👥 Shadow run: {shadow_route.upper()} → {shadow_result['model']}"):
+            if shadow_result['success']:
+                st.markdown(shadow_result['response'])
+                st.caption(f"⚡ {shadow_result['latency']:.2f}s | 💰 ${shadow_result['cost']:.6f}")
+                # Not a routed query, but its spend is real
+                st.session_state.total_cost[shadow_route] += shadow_result['cost']
+            else:
+                st.error(f"Error: {shadow_result.get('error', 'Unknown error')}")
+
+# Side-by-side comparison: both models run concurrently
+if query and compare_both:
+    st.markdown("---")
+    st.markdown(f"### ⚖️ Comparing: <span class='local-route'>LOCAL</span> → {local_model} vs "
+                f"<span class='cloud-route'>CLOUD</span> → {cloud_model}",
+               unsafe_allow_html=True)
+
+    with st.spinner("Running local and cloud models concurrently..."):
+        start_time = time.time()
+        results = compare_inference(query, local_model, cloud_model, use_cache=False, low_latency=low_latency)
+        wall_time = time.time() - start_time
+
+    sequential_time = sum(r['latency'] for r in results if r['success'])
+    st.caption(f"⏱️ Wall time {wall_time:.2f}s vs {sequential_time:.2f}s if run one after the other")
+
+    for column, route, result in zip(st.columns(2), ("local", "cloud"), results):
+        with column:
+            st.markdown(f"#### {'🏠 Local' if route == 'local' else '☁️ Cloud'}: {result['model']}")
+            if result['success']:
+                st.markdown(result['response'])
+                st.metric("⚡ Latency", f"{result['latency']:.2f}s")
+                st.metric("💰 Cost", f"${result['cost']:.6f}")
+                # Not a routed query, but its spend is real
+                st.session_state.total_cost[route] += result['cost']
+            else:
+                st.error(f"Error: {result.get('error', 'Unknown error')}")
 
 # Query History
-if st.session_state.queries:
+# History runs as a fragment: its widgets rerun only this panel, so adjusting
+# replay options leaves the response above on screen
+@st.fragment
+def history_panel(local_model: str, cloud_model: str, low_latency: bool):
+    """Replay controls, pending batch jobs and the recent-queries table"""
     st.markdown("---")
     st.header("📜 Query History")
 
-    for idx, q in enumerate(reversed(st.session_state.queries[-10:])):  # Show last 10
-        with st.expander(f"Query {len(st.session_state.queries) - idx}: {q['query'][:50]}..."):
-            col_hist1, col_hist2, col_hist3, col_hist4 = st.columns(4)
-
-            with col_hist1:
-                st.write(f"**Route:** {q['route'].upper()}")
-            with col_hist2:
-                st.write(f"**Model:** {q['model'].split(':')[0]}")
-            with col_hist3:
-                st.write(f"**Latency:** {q['latency']:.2f}s")
-            with col_hist4:
-                st.write(f"**Cost:** ${q['cost']:.6f}")
+    # Replay and the table need history; pending batches are shown even without it
+    if st.session_state.queries:
+        # Replay: re-route past queries and run them concurrently
+        max_replay = min(50, len(st.session_state.queries))
+        col_replay1, col_replay2, col_replay3, col_replay4 = st.columns(4)
+        with col_replay1:
+            replay_count = st.number_input("Queries to replay", min_value=1, max_value=max_replay,
+                                           value=min(10, max_replay))
+        with col_replay2:
+            replay_fresh = st.checkbox("Bypass response cache", value=True,
+                                       help="Call the models again instead of returning cached answers")
+            batch_mode = st.checkbox("Batch mode (cheaper, slower)",
+                                     help="Send cloud-routed queries through the provider's batch API at 50% off")
+        with col_replay3:
+            batch_wait = st.number_input("Batch wait (s)", min_value=0, max_value=3600, value=120, step=30,
+                                         disabled=not batch_mode,
+                                         help="Replay online if the batch is not done by then; 0 queues it for later")
+        with col_replay4:
+            run_replay = st.button("🔁 Replay last N", use_container_width=True)
+
+        if run_replay:
+            replay_batch = [q['query'] for q in islice(reversed(st.session_state.queries), replay_count)][::-1]
+            online_queries, pending = replay_batch, None
+            if batch_mode:
+                routes = [route_for_replay(q)['route'] for q in replay_batch]
+                batch_queries = [q for q, r in zip(replay_batch, routes) if r == "cloud"]
+                if batch_queries:
+                    try:
+                        pending = submit_batch(batch_queries, cloud_model)
+                        online_queries = [q for q, r in zip(replay_batch, routes) if r == "local"]
+                    except Exception as e:
+                        st.error(f"Batch submission failed, replaying online instead: {e}")
+
+            if online_queries:
+                replay_online(online_queries, local_model, cloud_model, use_cache=not replay_fresh,
+                              low_latency=low_latency)
+
+            # Track the batch before waiting: if the wait is interrupted, "Check batch status" still collects it
+            if pending:
+                st.session_state.batches.append(pending)
+            if pending and batch_wait == 0:
+                st.success(f"Queued {len(pending['queries'])} cloud queries as batch {pending['id']}")
+            elif pending:
+                with st.spinner(f"Waiting up to {batch_wait}s for batch {pending['id']}..."):
+                    try:
+                        status, batch_results = wait_for_batch(pending, batch_wait)
+                    except Exception as e:
+                        status, batch_results = f"unreachable ({e})", {}
+                if status == "completed":
+                    added = record_batch_results(pending, batch_results)
+                    st.session_state.batches.remove(pending)
+                    st.success(f"Batch {pending['id']} completed: {added}/{len(pending['queries'])} results added to history")
+                else:
+                    try:
+                        cancel_batch(pending)
+                    except Exception as e:
+                        st.error(f"Could not cancel batch {pending['id']}: {e}")
+                    st.session_state.batches.remove(pending)
+                    st.warning(f"Batch {pending['id']} {status} after {batch_wait}s - cancelled, sending its queries to the cloud online")
+                    replay_online(pending['queries'], local_model, cloud_model, use_cache=not replay_fresh, route="cloud",
+                                  low_latency=low_latency)
+
+    # Pending batch jobs
+    if st.session_state.batches:
+        st.caption(f"📦 {len(st.session_state.batches)} batch job(s) pending")
+        if st.button("🔄 Check batch status"):
+            for batch in list(st.session_state.batches):
+                try:
+                    status, batch_results = collect_batch(batch)
+                except Exception as e:
+                    st.error(f"Batch {batch['id']}: {e}")
+                    continue
+                if status not in BATCH_DONE:
+                    st.info(f"Batch {batch['id']}: {status}")
+                    continue
+                st.session_state.batches.remove(batch)
+                if status == "completed":
+                    added = record_batch_results(batch, batch_results)
+                    st.success(f"Batch {batch['id']} completed: {added} results added to history")
+                else:
+                    st.error(f"Batch {batch['id']} {status}")
+
+    if st.session_state.queries:
+        # Last 10 queries, newest first, rendered as a single table
+        history_df = pd.DataFrame(list(islice(reversed(st.session_state.queries), 10))).reindex(
+            columns=['timestamp', 'route', 'model', 'tier', 'latency', 'cost', 'complexity_score', 'query']
+        )
+        history_df['timestamp'] = pd.to_datetime(history_df['timestamp'])
+        history_df['route'] = history_df['route'].str.upper()
+
+        st.dataframe(
+            history_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'timestamp': st.column_config.DatetimeColumn("Time", format="HH:mm:ss"),
+                'route': "Route",
+                'model': "Model",
+                'tier': "Tier",
+                'latency': st.column_config.NumberColumn("Latency", format="%.2fs"),
+                'cost': st.column_config.NumberColumn("Cost", format="$%.6f"),
+                'complexity_score': st.column_config.NumberColumn("Complexity", format="%.2f"),
+                'query': st.column_config.TextColumn("Query", width="large")
+            }
+        )
 
-            st.write(f"**Complexity:** {q['complexity_score']:.2f}")
+# Batches outlive Clear History, so the panel stays reachable while any are pending
+if st.session_state.queries or st.session_state.batches:
+    history_panel(local_model, cloud_model, low_latency)
 
 # Footer
 st.markdown("---")
-st.markdown("""
-<div style='text-align: center; color: #666; padding: 20px;'>
-    <strong>LeniLani Consulting</strong> | AI & Technology Consulting for Hawaii Businesses<br>
-    808-XXX-XXXX | reno@lenilani.com | lenilani.com
-</div>
-""", unsafe_allow_html=True)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
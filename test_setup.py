@@ -7,6 +7,20 @@ Run this BEFORE your client demo to ensure everything works
 import sys
 import subprocess
 
+_OLLAMA_LIST_CACHE = None
+
+def _cached_ollama_list():
+    """Run `ollama list` once and share the result between the service and model checks"""
+    global _OLLAMA_LIST_CACHE
+    if _OLLAMA_LIST_CACHE is None:
+        _OLLAMA_LIST_CACHE = subprocess.run(
+            ["ollama", "list"],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+    return _OLLAMA_LIST_CACHE
+
 def test_imports():
     """Test that all required packages are installed"""
     print("Testing imports...")
@@ -36,18 +50,25 @@ def test_imports():
     except ImportError:
         print("⚠️  OpenAI not installed (optional). Run: pip install openai --break-system-packages")
 
+    try:
+        import ahocorasick
+        print("✅ pyahocorasick installed")
+    except ImportError:
+        print("⚠️  pyahocorasick not installed (optional, faster routing). Run: pip install pyahocorasick --break-system-packages")
+
+    try:
+        import tiktoken
+        print("✅ tiktoken installed")
+    except ImportError:
+        print("⚠️  tiktoken not installed (optional, accurate token counts). Run: pip install tiktoken --break-system-packages")
+
     return True
 
 def test_ollama_service():
     """Test that Ollama service is running"""
     print("\nTesting Ollama service...")
     try:
-        result = subprocess.run(
-            ["ollama", "list"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+        result = _cached_ollama_list()
 
         if result.returncode == 0:
             print("✅ Ollama service is running")
@@ -69,11 +90,7 @@ def test_model_availability():
     """Test that required model is available"""
     print("\nTesting model availability...")
     try:
-        result = subprocess.run(
-            ["ollama", "list"],
-            capture_output=True,
-            text=True
-        )
+        result = _cached_ollama_list()
 
         models = result.stdout.lower()
 